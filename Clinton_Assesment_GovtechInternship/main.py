@@ -9,9 +9,13 @@ error handling are built in.
 Key flags:
   --pretty    Pretty-print JSON
   --summary   Print a small stats report
-  --wrap      Wrap output array with {"metadata": ..., "entries": [...]}
+  --wrap      Wrap output array with {"entries": [...], "metadata": ...}
+  --ndjson    Write newline-delimited JSON (one record per line) instead of an array
   --errors    Write a simple error log (line number + reason)
   --strict    Exit with code 2 if any lines failed to parse
+  --no-iso-times  Leave out the time_iso_utc field (skips time conversion)
+  --jobs N    Parse big inputs with N worker processes (default: CPU count)
+  --ua-cache-size N   How many distinct User-Agents to memoize (default 50000, or $UA_CACHE)
 
 Examples:
   python main.py -i sample_access.log -o output.json --pretty
@@ -21,19 +25,47 @@ Examples:
 Tip:
   For better UA detection, install:
     pip install user-agents
+  Optional speed-ups (picked up automatically when installed):
+    pip install orjson pyahocorasick
+  The script is typed so it also compiles with mypyc (pip install mypy; mypyc main.py).
 """
 
 from __future__ import annotations
 
 import argparse
+import functools
+import io
+import itertools
 import json
+import multiprocessing
+import os
 import re
+import stat
 import sys
+import tempfile
 import time
-from dataclasses import dataclass, asdict
-from datetime import datetime, timezone
-from typing import Dict, Any, Iterable, Optional, List, Tuple
-from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import BinaryIO, Callable, Dict, Any, Iterable, Iterator, Optional, List, Set, TextIO, Tuple, TypeVar, Union
+from collections import Counter, deque
+
+__all__ = [
+    "COMBINED_REGEX",
+    "parse_time_local",
+    "parse_request",
+    "enrich_user_agent",
+    "set_ua_cache_size",
+    "ua_cache_info",
+    "parse_line",
+    "iter_records",
+    "process_stream",
+    "write_ndjson",
+    "write_ndjson_lines",
+    "write_json_array",
+    "SummaryAccumulator",
+    "print_summary",
+    "main",
+]
 
 # Optional dependency: richer UA parsing if available
 try:
@@ -41,12 +73,29 @@ try:
 except Exception:
     ua_parse = None  # fallback to heuristics if not installed
 
+# Optional dependency: much faster JSON encoding
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore  # fallback to stdlib json
+
+# Optional dependency: one-pass multi-substring matching for UA heuristics
+try:
+    import ahocorasick  # type: ignore  # pip install pyahocorasick
+except Exception:
+    ahocorasick = None  # type: ignore  # fallback to plain substring checks
+
 
 # --- Nginx "combined" log regex ---
 # Format:
 #   $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent
 #   "$http_referer" "$http_user_agent"
-COMBINED_REGEX = re.compile(
+# Most lines are split by _split_combined_fast(); the regex is the fallback.
+# It only ever sees the odd lines the splitter rejects, one at a time, so there is
+# no bulk scan worth batching (Hyperscan-style block mode would also lose the
+# capture groups). The stdlib engine is also much faster per match than the re2
+# bindings (~20x on a typical line), so the regex stays on plain re.
+_COMBINED_PATTERN = (
     r'(?P<remote_addr>\S+)\s+'           # e.g. 203.0.113.10
     r'(?P<identd>-)\s+'                  # usually "-"
     r'(?P<remote_user>\S+)\s+'           # user or "-"
@@ -57,37 +106,118 @@ COMBINED_REGEX = re.compile(
     r'"(?P<http_referer>[^"]*)"\s+'      # "https://example.com"
     r'"(?P<http_user_agent>[^"]*)"'      # "Mozilla/5.0 ..."
 )
+# Each field's class excludes the separator that follows it, so giving characters
+# back can never rescue a match. On 3.11+ the same fields use possessive quantifiers
+# and a bad line fails at the first mismatch instead of backtracking through every
+# field. Keep the two patterns in step (tests compare their matches).
+_COMBINED_PATTERN_POSSESSIVE = (
+    r'(?P<remote_addr>\S++)\s++'
+    r'(?P<identd>-)\s++'
+    r'(?P<remote_user>\S++)\s++'
+    r'\[(?P<time_local>[^\]]++)\]\s++'
+    r'"(?P<request>[^"]*+)"\s++'
+    r'(?P<status>\d{3})\s++'
+    r'(?P<body_bytes_sent>\S++)\s++'
+    r'"(?P<http_referer>[^"]*+)"\s++'
+    r'"(?P<http_user_agent>[^"]*+)"'
+)
+if sys.version_info >= (3, 11):
+    COMBINED_REGEX = re.compile(_COMBINED_PATTERN_POSSESSIVE)
+else:
+    COMBINED_REGEX = re.compile(_COMBINED_PATTERN)
+
+# Bound once so the per-line fallback skips the attribute lookups; fields are read
+# positionally via m.groups() (no groupdict() per line).
+_match_combined = COMBINED_REGEX.match
 
 NGINX_TIME_FMT = "%d/%b/%Y:%H:%M:%S %z"  # e.g. 12/Sep/2025:09:12:03 +0800
+_MONTHS = {
+    "Jan": 1, "Feb": 2, "Mar": 3, "Apr": 4, "May": 5, "Jun": 6,
+    "Jul": 7, "Aug": 8, "Sep": 9, "Oct": 10, "Nov": 11, "Dec": 12,
+}
 
 
-# --- Small, tidy structure for UA output ---
-@dataclass
-class UAInfo:
-    browser: Dict[str, Optional[str]]
-    os: Dict[str, Optional[str]]
-    device: Dict[str, Optional[str] | Optional[bool]]
-
-    @staticmethod
-    def empty() -> "UAInfo":
-        """Default shape when UA is missing or unknown."""
-        return UAInfo(
-            browser={"family": None, "version": None},
-            os={"family": None, "version": None},
-            device={
-                "family": None,   # e.g. "iPad", "iPhone" (when known)
-                "type": None,     # "Mobile" | "Tablet" | "PC" | "Bot" | "Other"
-                "is_mobile": None,
-                "is_tablet": None,
-                "is_pc": None,
-                "is_bot": None,
-            },
-        )
+def _env_int(name: str, default: int) -> int:
+    """Integer from the environment; a bad value is warned about, not fatal at import."""
+    raw = os.environ.get(name)
+    if raw is None:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        print(f"Warning: ignoring {name}={raw!r} (not an integer); using {default}", file=sys.stderr)
+        return default
+
+
+# Real traffic repeats the same handful of UA strings over and over,
+# so the enriched result is memoized per distinct UA string.
+UA_CACHE_SIZE = _env_int("UA_CACHE", 50000)
+
+# Parallel parsing: lines are farmed out to worker processes in fixed-size chunks,
+# but only once the input is big enough to pay for starting the pool.
+PARALLEL_CHUNK_LINES = 10000
+PARALLEL_MIN_LINES = 50000
+
+# Read input in 1 MiB blocks (default is 8 KiB): far fewer read() calls on big logs.
+INPUT_BUFFER_SIZE = 1 << 20
+
+
+# --- Small, tidy structure for UA output (plain dicts: they go straight to JSON) ---
+def _empty_ua_info() -> Dict[str, Dict[str, Any]]:
+    """Default shape when UA is missing or unknown."""
+    return {
+        "browser": {"family": None, "version": None},
+        "os": {"family": None, "version": None},
+        "device": {
+            "family": None,   # e.g. "iPad", "iPhone" (when known)
+            "type": None,     # "Mobile" | "Tablet" | "PC" | "Bot" | "Other"
+            "is_mobile": None,
+            "is_tablet": None,
+            "is_pc": None,
+            "is_bot": None,
+        },
+    }
+
+
+# Lines without a User-Agent all share this one (read-only) result.
+_EMPTY_UA = _empty_ua_info()
 
 
 # --- Helpers: time & request parsing ---
-def parse_time_local(s: str) -> str:
-    """Convert Nginx time_local to ISO8601 (UTC). If parsing fails, return original."""
+def _parse_time_local_fixed(s: str) -> str:
+    """Fast path for the exact 'DD/Mon/YYYY:HH:MM:SS +HHMM' layout Nginx writes."""
+    if len(s) != 26 or s[2] != "/" or s[6] != "/" or s[11] != ":" or s[14] != ":" \
+            or s[17] != ":" or s[20] != " ":
+        raise ValueError("not in Nginx time_local layout")
+    digits = s[0:2] + s[7:11] + s[12:14] + s[15:17] + s[18:20] + s[22:26]
+    if s[21] not in "+-" or not (digits.isascii() and digits.isdigit()):
+        raise ValueError("not in Nginx time_local layout")  # int() would accept spaces/signs
+    if s[18:20] > "59":
+        raise ValueError("second must be in 0..59")
+    # Offsets are whole minutes, so the seconds pass through the UTC shift unchanged.
+    return _utc_minute_prefix(s[:17], s[21:]) + s[18:20] + "+00:00"
+
+
+# Lines whose time_local differs only in the seconds share one conversion.
+@functools.lru_cache(maxsize=1024)
+def _utc_minute_prefix(minute: str, tz: str) -> str:
+    """'YYYY-MM-DDTHH:MM:' in UTC for a local 'DD/Mon/YYYY:HH:MM' and a '+HHMM' offset."""
+    tz_h, tz_m = int(tz[1:3]), int(tz[3:5])
+    if tz_h > 23 or tz_m > 59:
+        raise ValueError("bad UTC offset")
+    offset = timedelta(hours=tz_h, minutes=tz_m)
+    dt = datetime(int(minute[7:11]), _MONTHS[minute[3:6]], int(minute[0:2]),
+                  int(minute[12:14]), int(minute[15:17]), tzinfo=timezone.utc)
+    return (dt - offset if tz[0] == "+" else dt + offset).isoformat()[:-len("00+00:00")]
+
+
+# Busy logs write many lines per second, so the same time_local repeats.
+@functools.lru_cache(maxsize=4096)
+def _parse_time_local_cached(s: str) -> str:
+    try:
+        return _parse_time_local_fixed(s)
+    except (KeyError, ValueError, OverflowError):
+        pass
     try:
         dt = datetime.strptime(s, NGINX_TIME_FMT)
         return dt.astimezone(timezone.utc).isoformat()
@@ -95,58 +225,183 @@ def parse_time_local(s: str) -> str:
         return s
 
 
-def parse_request(req: str) -> Dict[str, Optional[str]]:
-    """Split 'METHOD path ... HTTP/x.y' robustly. Protocol = last token that starts with HTTP/."""
-    method = path = protocol = None
-    if req:
-        parts = req.split()
-        if parts:
-            method = parts[0]
-        if len(parts) >= 2:
-            path = parts[1]  # keep it simple; we ignore middle tokens in 'request' field
-        # protocol: prefer last token that looks like HTTP/??
-        for tok in reversed(parts):
-            if tok.upper().startswith("HTTP/"):
+def parse_time_local(s: str) -> str:
+    """Convert Nginx time_local to ISO8601 (UTC). If parsing fails, return original."""
+    return _parse_time_local_cached(s)
+
+
+# Canonical strs for the methods/protocols real traffic uses, so kept records share
+# one object each. A fixed table rather than sys.intern(): the request line is client
+# text (scanner junk, TLS handshakes) and interned strings are never freed.
+_SHARED_METHODS = {m: m for m in (
+    "GET", "HEAD", "POST", "PUT", "DELETE", "PATCH", "OPTIONS", "CONNECT", "TRACE",
+)}
+_SHARED_PROTOCOLS = {p: p for p in ("HTTP/1.0", "HTTP/1.1", "HTTP/2.0", "HTTP/2", "HTTP/3")}
+
+
+def _is_http_token(tok: str) -> bool:
+    return tok[:5].upper() == "HTTP/"
+
+
+def parse_request(req: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+    """
+    Split 'METHOD path ... HTTP/x.y' robustly into (method, path, protocol).
+    Protocol = last token that starts with HTTP/.
+    """
+    method: Optional[str] = None
+    path: Optional[str] = None
+    protocol: Optional[str] = None
+    if not req:
+        return method, path, protocol
+
+    # Common case "METHOD path HTTP/x.y": exactly three non-empty tokens and single
+    # spaces. The split is bounded, so a request full of spaces can't blow it up.
+    head = req.split(" ", 3)
+    if len(head) == 3 and head[0] and head[1] and head[2] and req.isprintable():
+        method, path, tail = head
+        for tok in (tail, path, method):
+            if _is_http_token(tok):
                 protocol = tok
                 break
-    return {"method": method, "path": path, "protocol": protocol}
+        return method, path, protocol
+
+    parts = req.split()
+    if parts:
+        method = parts[0]
+    if len(parts) >= 2:
+        path = parts[1]  # keep it simple; we ignore middle tokens in 'request' field
+    # protocol: prefer last token that looks like HTTP/??
+    for tok in reversed(parts):
+        if _is_http_token(tok):
+            protocol = tok
+            break
+    return method, path, protocol
+
+
+# --- UA token scan ---
+# Every lowercase keyword the heuristics look for gets one bit. A UA is scanned
+# once (Aho-Corasick when available) and the decisions below test bits instead
+# of re-scanning the string for each keyword.
+_UA_TOKENS = (
+    "edg", "edg/", " edge/", " edg ", "opr", "opr/", " opera",
+    "chrome", "chrome/", "firefox/", "safari/",
+    "windows", "windows nt 6.1", "windows nt 6.2", "windows nt 6.3", "windows nt 10.0", "windows 11",
+    "mac os x", "macintosh", "android", "iphone", "ipad", "cpu iphone os", "cpu os", "linux",
+    "bot", "spider", "crawler", "tablet", "mobile", "sm-t",
+)
+_UA_TOKEN_BITS = tuple((tok, 1 << i) for i, tok in enumerate(_UA_TOKENS))
+_UA_BIT = dict(_UA_TOKEN_BITS)
+
+# Without Aho-Corasick: keywords that contain a shorter keyword are only looked
+# for once that one was found, so a typical UA needs far fewer substring scans.
+_UA_TOKEN_GROUPS: Tuple[Tuple[str, int, Tuple[Tuple[str, int], ...]], ...] = tuple(
+    (tok, bit, tuple((sub, sub_bit) for sub, sub_bit in _UA_TOKEN_BITS if sub != tok and tok in sub))
+    for tok, bit in _UA_TOKEN_BITS
+    if not any(other != tok and other in tok for other in _UA_TOKENS)
+)
+
+
+def _ua_mask(*tokens: str) -> int:
+    mask = 0
+    for tok in tokens:
+        mask |= _UA_BIT[tok]
+    return mask
+
+
+_M_EDGE = _ua_mask("edg/", " edge/", " edg ")
+_M_OPERA = _ua_mask("opr/", " opera")
+_M_CHROME = _ua_mask("chrome/")
+_M_EDG_OR_OPR = _ua_mask("edg", "opr")
+_M_ANY_CHROME = _ua_mask("chrome")
+_M_FIREFOX = _ua_mask("firefox/")
+_M_SAFARI = _ua_mask("safari/")
+_M_WINDOWS = _ua_mask("windows")
+_M_MACOS = _ua_mask("mac os x", "macintosh")
+_M_ANDROID = _ua_mask("android")
+_M_IOS = _ua_mask("iphone", "ipad", "cpu iphone os", "cpu os")
+_M_LINUX = _ua_mask("linux")
+_M_BOT = _ua_mask("bot", "spider", "crawler")
+_M_IPAD = _ua_mask("ipad")
+_M_IPHONE = _ua_mask("iphone")
+_M_TABLET = _ua_mask("ipad", "tablet")
+_M_MOBILE = _ua_mask("mobile", "iphone")
+_M_PC = _ua_mask("windows", "mac os x", "linux")
+_M_TABLET_HINT = _ua_mask("tablet", "ipad", "sm-t")
+
+if ahocorasick is not None:
+    _UA_AUTOMATON = ahocorasick.Automaton()
+    for _tok, _bit in _UA_TOKEN_BITS:
+        _UA_AUTOMATON.add_word(_tok, _bit)
+    _UA_AUTOMATON.make_automaton()
+else:
+    _UA_AUTOMATON = None
+
+
+def _scan_ua_tokens(ua_lc: str) -> int:
+    """Bitmask of every _UA_TOKENS keyword found in the lowercased UA."""
+    flags = 0
+    if _UA_AUTOMATON is not None:
+        for _, bit in _UA_AUTOMATON.iter(ua_lc):
+            flags |= bit
+    else:
+        for tok, bit, longer in _UA_TOKEN_GROUPS:
+            if tok in ua_lc:
+                flags |= bit
+                for sub, sub_bit in longer:
+                    if sub in ua_lc:
+                        flags |= sub_bit
+    return flags
+
+
+# OS version patterns, compiled once. Kept separate (not one alternation) because the
+# family is picked by priority, not by which keyword happens to come first in the UA.
+_MACOS_VER_SEARCH = re.compile(r"mac os x ([0-9_\.]+)").search
+_ANDROID_VER_SEARCH = re.compile(r"android ([0-9\.]+)").search
+_IPHONE_OS_VER_SEARCH = re.compile(r"iphone os ([0-9_]+)").search
+_CPU_OS_VER_SEARCH = re.compile(r"cpu (?:iphone )?os ([0-9_]+)").search
 
 
 # --- UA enrichment (library first, then safe fallbacks) ---
-def _guess_windows_version_from_ua(ua_lc: str) -> Optional[str]:
+def _guess_windows_version_from_ua(flags: int) -> Optional[str]:
     # Many Win11 UAs still say "Windows NT 10.0". If it literally says "Windows 11", call it 11.
-    if "windows nt 6.1" in ua_lc:
+    if flags & _UA_BIT["windows nt 6.1"]:
         return "7"
-    if "windows nt 6.2" in ua_lc:
+    if flags & _UA_BIT["windows nt 6.2"]:
         return "8"
-    if "windows nt 6.3" in ua_lc:
+    if flags & _UA_BIT["windows nt 6.3"]:
         return "8.1"
-    if "windows nt 10.0" in ua_lc:
-        return "11" if "windows 11" in ua_lc else "10"
+    if flags & _UA_BIT["windows nt 10.0"]:
+        return "11" if flags & _UA_BIT["windows 11"] else "10"
     return None
 
 
-def enrich_user_agent(ua_string: str) -> UAInfo:
-    """Turn a UA string into {browser, os, device} details."""
-    info = UAInfo.empty()
+def _enrich_user_agent_uncached(ua_string: str) -> Dict[str, Dict[str, Any]]:
+    """Turn a UA string into {browser, os, device} details (uncached)."""
+    info = _empty_ua_info()
     if not ua_string:
         return info
 
+    # Lowercase and keyword-scan once; both the library override and the heuristics use it.
+    # (str.lower() has an ASCII fast path and beats encode() + bytes.translate() here.)
+    ua_lc = ua_string.lower()
+    flags = _scan_ua_tokens(ua_lc)
+    browser, os_, device = info["browser"], info["os"], info["device"]
+
     # Preferred: use user-agents if present
     if ua_parse is not None:
         ua = ua_parse(ua_string)
 
-        info.browser["family"] = ua.browser.family or None
-        info.browser["version"] = ua.browser.version_string or None
+        browser["family"] = ua.browser.family or None
+        browser["version"] = ua.browser.version_string or None
 
-        info.os["family"] = ua.os.family or None
-        info.os["version"] = ua.os.version_string or None
+        os_["family"] = ua.os.family or None
+        os_["version"] = ua.os.version_string or None
 
-        info.device["family"] = ua.device.family or None
-        info.device["is_mobile"] = bool(ua.is_mobile)
-        info.device["is_tablet"] = bool(ua.is_tablet)
-        info.device["is_pc"] = bool(ua.is_pc)
-        info.device["is_bot"] = bool(ua.is_bot)
+        device["family"] = ua.device.family or None
+        device["is_mobile"] = bool(ua.is_mobile)
+        device["is_tablet"] = bool(ua.is_tablet)
+        device["is_pc"] = bool(ua.is_pc)
+        device["is_bot"] = bool(ua.is_bot)
 
 
         # Decide type from library
@@ -162,195 +417,524 @@ def enrich_user_agent(ua_string: str) -> UAInfo:
             dtype = "Other"
 
         # --- OVERRIDE: if UA string clearly indicates a tablet, force Tablet ---
-        ua_lc = ua_string.lower()
-        looks_like_tablet = (
-            ("tablet" in ua_lc) or
-            ("ipad" in ua_lc) or
-            (" sm-t" in ua_lc) or ("sm-t" in ua_lc)
-        )
-        if looks_like_tablet:
+        if flags & _M_TABLET_HINT:
             dtype = "Tablet"
-            info.device["is_tablet"] = True
-            info.device["is_mobile"] = False
-            if "ipad" in ua_lc:
-                info.device["family"] = "iPad"
+            device["is_tablet"] = True
+            device["is_mobile"] = False
+            if flags & _M_IPAD:
+                device["family"] = "iPad"
 
-        info.device["type"] = dtype
+        device["type"] = dtype
         return info
 
     # Fallback heuristics (works without extra installs)
-    ua_lc = ua_string.lower()
 
     # Browser family (basic)
-    if "edg/" in ua_lc or " edge/" in ua_lc or " edg " in ua_lc:
-        info.browser["family"] = "Edge"
-    elif "opr/" in ua_lc or " opera" in ua_lc:
-        info.browser["family"] = "Opera"
-    elif "chrome/" in ua_lc and "edg" not in ua_lc and "opr" not in ua_lc:
-        info.browser["family"] = "Chrome"
-    elif "firefox/" in ua_lc:
-        info.browser["family"] = "Firefox"
-    elif "safari/" in ua_lc and "chrome" not in ua_lc:
-        info.browser["family"] = "Safari"
-
-    # OS family + version (best effort)
-    if "windows" in ua_lc:
-        info.os["family"] = "Windows"
-        info.os["version"] = _guess_windows_version_from_ua(ua_lc)
-    elif "mac os x" in ua_lc or "macintosh" in ua_lc:
-        info.os["family"] = "macOS"
-        m = re.search(r"mac os x ([0-9_\.]+)", ua_lc)
+    if flags & _M_EDGE:
+        browser["family"] = "Edge"
+    elif flags & _M_OPERA:
+        browser["family"] = "Opera"
+    elif flags & _M_CHROME and not flags & _M_EDG_OR_OPR:
+        browser["family"] = "Chrome"
+    elif flags & _M_FIREFOX:
+        browser["family"] = "Firefox"
+    elif flags & _M_SAFARI and not flags & _M_ANY_CHROME:
+        browser["family"] = "Safari"
+
+    # OS family + version (best effort; version regexes only run once the family matched)
+    if flags & _M_WINDOWS:
+        os_["family"] = "Windows"
+        os_["version"] = _guess_windows_version_from_ua(flags)
+    elif flags & _M_MACOS:
+        os_["family"] = "macOS"
+        m = _MACOS_VER_SEARCH(ua_lc)
         if m:
-            info.os["version"] = m.group(1).replace("_", ".")
-    elif "android" in ua_lc:
-        info.os["family"] = "Android"
-        m = re.search(r"android ([0-9\.]+)", ua_lc)
+            os_["version"] = m.group(1).replace("_", ".")
+    elif flags & _M_ANDROID:
+        os_["family"] = "Android"
+        m = _ANDROID_VER_SEARCH(ua_lc)
         if m:
-            info.os["version"] = m.group(1)
-    elif "iphone" in ua_lc or "ipad" in ua_lc or "cpu iphone os" in ua_lc or "cpu os" in ua_lc:
-        info.os["family"] = "iOS"
-        m = re.search(r"iphone os ([0-9_]+)", ua_lc) or re.search(r"cpu (?:iphone )?os ([0-9_]+)", ua_lc)
+            os_["version"] = m.group(1)
+    elif flags & _M_IOS:
+        os_["family"] = "iOS"
+        m = _IPHONE_OS_VER_SEARCH(ua_lc) or _CPU_OS_VER_SEARCH(ua_lc)
         if m:
-            info.os["version"] = m.group(1).replace("_", ".")
-    elif "linux" in ua_lc:
-        info.os["family"] = "Linux"
+            os_["version"] = m.group(1).replace("_", ".")
+    elif flags & _M_LINUX:
+        os_["family"] = "Linux"
 
     # Device type (tablet before mobile to avoid mislabeling Android tablets)
-    if any(k in ua_lc for k in ["bot", "spider", "crawler"]):
-        info.device["type"] = "Bot"
-        info.device["is_bot"] = True
-        info.device["is_mobile"] = False
-        info.device["is_tablet"] = False
-        info.device["is_pc"] = False
-
-    elif "ipad" in ua_lc or "tablet" in ua_lc or ("android" in ua_lc and "tablet" in ua_lc):
-        info.device["type"] = "Tablet"
-        info.device["is_tablet"] = True
-        info.device["is_mobile"] = False
-        info.device["is_pc"] = False
-        info.device["is_bot"] = False
-        info.device["family"] = "iPad" if "ipad" in ua_lc else None
-
-    elif "mobile" in ua_lc or "iphone" in ua_lc or ("android" in ua_lc and "mobile" in ua_lc):
-        info.device["type"] = "Mobile"
-        info.device["is_mobile"] = True
-        info.device["is_tablet"] = False
-        info.device["is_pc"] = False
-        info.device["is_bot"] = False
-        info.device["family"] = "iPhone" if "iphone" in ua_lc else None
-
-    elif "windows" in ua_lc or "mac os x" in ua_lc or "linux" in ua_lc:
-        info.device["type"] = "PC"
-        info.device["is_pc"] = True
-        info.device["is_mobile"] = False
-        info.device["is_tablet"] = False
-        info.device["is_bot"] = False
+    if flags & _M_BOT:
+        device["type"] = "Bot"
+        device["is_bot"] = True
+        device["is_mobile"] = False
+        device["is_tablet"] = False
+        device["is_pc"] = False
+
+    elif flags & _M_TABLET:
+        device["type"] = "Tablet"
+        device["is_tablet"] = True
+        device["is_mobile"] = False
+        device["is_pc"] = False
+        device["is_bot"] = False
+        device["family"] = "iPad" if flags & _M_IPAD else None
+
+    elif flags & _M_MOBILE:
+        device["type"] = "Mobile"
+        device["is_mobile"] = True
+        device["is_tablet"] = False
+        device["is_pc"] = False
+        device["is_bot"] = False
+        device["family"] = "iPhone" if flags & _M_IPHONE else None
+
+    elif flags & _M_PC:
+        device["type"] = "PC"
+        device["is_pc"] = True
+        device["is_mobile"] = False
+        device["is_tablet"] = False
+        device["is_bot"] = False
 
     else:
-        info.device["type"] = "Other"
-        info.device["is_mobile"] = False
-        info.device["is_tablet"] = False
-        info.device["is_pc"] = False
-        info.device["is_bot"] = False
+        device["type"] = "Other"
+        device["is_mobile"] = False
+        device["is_tablet"] = False
+        device["is_pc"] = False
+        device["is_bot"] = False
 
     return info
 
 
+_enrich_user_agent_cached = functools.lru_cache(maxsize=UA_CACHE_SIZE)(_enrich_user_agent_uncached)
+
+
+def set_ua_cache_size(maxsize: Optional[int]) -> None:
+    """Resize (and reset) the UA cache. 0 disables caching, None means unbounded."""
+    global _enrich_user_agent_cached, _ua_fragments_max
+    _enrich_user_agent_cached = functools.lru_cache(maxsize=maxsize)(_enrich_user_agent_uncached)
+    _ua_fragments_max = maxsize
+    _ua_fragments.clear()
+
+
+def ua_cache_info() -> Any:
+    """Hit/miss statistics of the UA cache (functools' CacheInfo) for this process."""
+    return _enrich_user_agent_cached.cache_info()
+
+
+def enrich_user_agent(ua_string: str) -> Dict[str, Any]:
+    """
+    Turn a UA string into a {browser, os, device} dict.
+    Results are cached and shared between records, so treat them as read-only.
+    """
+    if not ua_string:
+        return _EMPTY_UA  # shared even when the cache is disabled
+    return _enrich_user_agent_cached(ua_string)
+
+
 # --- One-line parser ---
-def parse_line(line: str, line_number: int) -> Tuple[Dict[str, Any], Optional[str]]:
+def _split_combined_fast(raw: str) -> Optional[Tuple[str, ...]]:
+    """
+    Split a well-formed combined line (single spaces between fields) with str.find.
+    Returns the fields in COMBINED_REGEX group order, or None to let the regex decide.
+    """
+    addr_end = raw.find(" ")
+    if addr_end <= 0 or raw[addr_end:addr_end + 3] != " - ":
+        return None
+    user_start = addr_end + 3
+    user_end = raw.find(" ", user_start)
+    if user_end <= user_start or raw[user_end + 1:user_end + 2] != "[":
+        return None
+    time_start = user_end + 2
+    time_end = raw.find('] "', time_start)
+    if time_end <= time_start:
+        return None
+    req_start = time_end + 3
+    req_end = raw.find('"', req_start)
+    if req_end < 0 or raw[req_end + 1:req_end + 2] != " ":
+        return None
+    status = raw[req_end + 2:req_end + 5]
+    bbs_start = req_end + 6
+    if not status.isdecimal() or raw[req_end + 5:bbs_start] != " ":
+        return None
+    bbs_end = raw.find(" ", bbs_start)
+    if bbs_end <= bbs_start or raw[bbs_end + 1:bbs_end + 2] != '"':
+        return None
+    ref_start = bbs_end + 2
+    ref_end = raw.find('"', ref_start)
+    if ref_end < 0 or raw[ref_end + 1:ref_end + 3] != ' "':
+        return None
+    ua_start = ref_end + 3
+    ua_end = raw.find('"', ua_start)
+    if ua_end < 0:
+        return None
+
+    remote_addr = raw[:addr_end]
+    remote_user = raw[user_start:user_end]
+    time_local = raw[time_start:time_end]
+    bbs = raw[bbs_start:bbs_end]
+    # Non-printable means tabs/odd whitespace inside a \S+ field, and ']' can't be in
+    # time_local: the regex splits those differently, so leave them to it.
+    if not (remote_addr.isprintable() and remote_user.isprintable() and bbs.isprintable()) \
+            or "]" in time_local:
+        return None
+    return (remote_addr, "-", remote_user, time_local, raw[req_start:req_end],
+            status, bbs, raw[ref_start:ref_end], raw[ua_start:ua_end])
+
+
+def parse_line(line: str, line_number: int, emit_iso: bool = True) -> Tuple[Dict[str, Any], Optional[str]]:
     """
     Parse a single log line.
+    With emit_iso=False the time_iso_utc field is left out (and never computed).
     Returns (record_dict, error_reason or None).
     """
-    raw = line.rstrip("\r\n")
-    if not raw:
-        return ({"line_number": line_number, "parse_ok": False, "raw": ""}, "empty line")
-
-    m = COMBINED_REGEX.match(raw)
-    if not m:
-        return (
-            {
-                "line_number": line_number,
-                "raw": raw,
-                "parse_ok": False,
-                "error": "Line does not match Nginx combined format",
-            },
-            "regex_mismatch",
-        )
-
-    gd = m.groupdict()
-
-    # Safe conversions
-    try:
-        status = int(gd.get("status", "0"))
-    except Exception:
-        status = 0
-
-    bbs = gd.get("body_bytes_sent")
-    try:
-        body_bytes = int(bbs) if bbs and bbs.isdigit() else 0
-    except Exception:
-        body_bytes = 0
-
-    req = parse_request(gd.get("request", "") or "")
-    ua_info = enrich_user_agent(gd.get("http_user_agent", "") or "")
+    # The splitter ignores whatever follows the closing quote, so a well-formed line
+    # needs no rstrip() copy; only the fallback works on the stripped text.
+    fields = _split_combined_fast(line)
+    if fields is None:
+        raw = line.rstrip("\r\n")
+        if not raw:
+            return ({"line_number": line_number, "parse_ok": False, "raw": ""}, "empty line")
+
+        # The regex needs six quotes and a '[': lines without them can't match, skip the engine.
+        if raw.count('"') < 6 or "[" not in raw:
+            m = None
+        else:
+            m = _match_combined(raw)
+        if not m:
+            return (
+                {
+                    "line_number": line_number,
+                    "raw": raw,
+                    "parse_ok": False,
+                    "error": "Line does not match Nginx combined format",
+                },
+                "regex_mismatch",
+            )
+        fields = m.groups()
+
+    remote_addr, _identd, remote_user, time_local, request, status_s, bbs, referer, ua_s = fields
+
+    # Both splitters only accept 3 decimal digits for status, so int() can't fail.
+    # isdecimal() (unlike isdigit()) is exactly what int() accepts, so no try needed.
+    status = int(status_s)
+    body_bytes = int(bbs) if bbs.isdecimal() else 0
+
+    method, path, protocol = parse_request(request or "")
+    # Kept records share one str per well-known method/protocol (see _SHARED_METHODS).
+    if method is not None:
+        method = _SHARED_METHODS.get(method, method)
+    if protocol is not None:
+        protocol = _SHARED_PROTOCOLS.get(protocol, protocol)
+    ua_info = enrich_user_agent(ua_s or "")
 
     record: Dict[str, Any] = {
         "line_number": line_number,
         "parse_ok": True,
 
-        "remote_addr": gd.get("remote_addr"),
-        "remote_user": None if gd.get("remote_user") == "-" else gd.get("remote_user"),
+        "remote_addr": remote_addr,
+        "remote_user": None if remote_user == "-" else remote_user,
 
-        "time_local": gd.get("time_local"),
-        "time_iso_utc": parse_time_local(gd.get("time_local", "")),
+        "time_local": time_local,
+    }
+    if emit_iso:  # left out entirely rather than written as null
+        record["time_iso_utc"] = parse_time_local(time_local or "")
 
-        "request": gd.get("request"),
-        "method": req["method"],
-        "path": req["path"],
-        "protocol": req["protocol"] ,
+    # Remaining fields, assigned in output order.
+    record["request"] = request
+    record["method"] = method
+    record["path"] = path
+    record["protocol"] = protocol
 
-        "status": status,
-        "body_bytes_sent": body_bytes,
+    record["status"] = status
+    record["body_bytes_sent"] = body_bytes
 
-        "http_referer": None if gd.get("http_referer") in (None, "-", "") else gd["http_referer"],
-        "http_user_agent": gd.get("http_user_agent") or None,
+    record["http_referer"] = None if referer in (None, "-", "") else referer
+    record["http_user_agent"] = ua_s or None
 
-        "ua": asdict(ua_info),
-    }
+    record["ua"] = ua_info
     return (record, None)
 
 
-def process_stream(lines: Iterable[str]) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
+def _parse_numbered(line: str, line_number: int, emit_iso: bool = True) -> Tuple[Dict[str, Any], Optional[str]]:
+    rec, err = parse_line(line, line_number, emit_iso)
+    if err is None and rec.get("parse_ok") is False:
+        err = rec.get("error", "unknown error")
+    return rec, err
+
+
+def _chunks(lines: Iterable[str], size: int) -> Iterator[Tuple[int, List[str]]]:
+    """Group lines into (first_line_number, lines) chunks."""
+    it = iter(lines)
+    start = 1
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+
+def _parse_chunk(job: Tuple[int, List[str]], emit_iso: bool = True) -> List[Tuple[Dict[str, Any], Optional[str]]]:
+    """Worker-side: parse one chunk (each process keeps its own UA cache)."""
+    start, chunk = job
+    return [_parse_numbered(line, i, emit_iso) for i, line in enumerate(chunk, start)]
+
+
+_T = TypeVar("_T")
+
+
+def _peek_parallel(lines: Iterable[str], jobs: int) -> Tuple[Iterator[str], bool]:
+    """Look far enough into `lines` to tell whether a process pool would pay off."""
+    it = iter(lines)
+    head = list(itertools.islice(it, PARALLEL_MIN_LINES)) if jobs > 1 else []
+    return itertools.chain(head, it), len(head) >= PARALLEL_MIN_LINES
+
+
+def _pool_map_chunks(lines: Iterable[str], jobs: int,
+                     worker: Callable[[Tuple[int, List[str]]], _T]) -> Iterator[_T]:
+    """Run a picklable `worker` over line chunks in a process pool; results come back in input order."""
+    ua_cache_size = _enrich_user_agent_cached.cache_parameters()["maxsize"]
+    with multiprocessing.Pool(jobs, initializer=set_ua_cache_size, initargs=(ua_cache_size,)) as pool:
+        # Keep a bounded number of chunks in flight so memory stays flat.
+        pending: deque = deque()
+        for job in _chunks(lines, PARALLEL_CHUNK_LINES):
+            pending.append(pool.apply_async(worker, (job,)))
+            if len(pending) >= 2 * jobs:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+
+
+def iter_records(lines: Iterable[str], jobs: int = 1,
+                 emit_iso: bool = True) -> Iterator[Tuple[Dict[str, Any], Optional[str]]]:
+    """
+    Lazily parse many lines, yielding (record, error_reason or None) per line.
+    With jobs > 1 and a large enough input, chunks are parsed in a process pool;
+    records still come back in input order.
+    """
+    it, parallel = _peek_parallel(lines, jobs)
+    if not parallel:
+        for i, line in enumerate(it, start=1):
+            yield _parse_numbered(line, i, emit_iso)
+        return
+    for parsed in _pool_map_chunks(it, jobs, functools.partial(_parse_chunk, emit_iso=emit_iso)):
+        yield from parsed
+
+
+def process_stream(lines: Iterable[str], jobs: int = 1,
+                   emit_iso: bool = True) -> Tuple[List[Dict[str, Any]], List[Tuple[int, str]]]:
     """Parse many lines; collect records and (line, error_reason) for any failures."""
     records: List[Dict[str, Any]] = []
     errors: List[Tuple[int, str]] = []
-    for i, line in enumerate(lines, start=1):
-        rec, err = parse_line(line, i)
+    for rec, err in iter_records(lines, jobs, emit_iso):
         records.append(rec)
-        if err is not None or rec.get("parse_ok") is False:
-            errors.append((i, err or rec.get("error", "unknown error")))
+        if err is not None:
+            errors.append((rec["line_number"], err))
     return records, errors
 
 
+# --- JSON output (streamed record by record, so memory stays flat) ---
+def _dumps(obj: Any, pretty: bool = False) -> bytes:
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if pretty else 0)
+        except orjson.JSONEncodeError:
+            pass  # e.g. integers wider than 64 bits; stdlib json copes
+    return json.dumps(obj, indent=2 if pretty else None, ensure_ascii=False).encode("utf-8")
+
+
+# Encoded "ua" objects for the stdlib-json splice: (ua_string, pretty) -> (ua dict, bytes).
+# The dict is kept so a record can be checked against it by identity; sized like the
+# UA cache (set_ua_cache_size keeps them in step) and simply cleared when full.
+_ua_fragments: Dict[Tuple[str, bool], Tuple[Dict[str, Any], bytes]] = {}
+_ua_fragments_max: Optional[int] = UA_CACHE_SIZE
+
+
+def _dumps_record(rec: Dict[str, Any], pretty: bool = False) -> bytes:
+    """
+    JSON for one record. orjson is fast enough to take it whole; with stdlib json
+    the (cached, shared) "ua" object is serialized once per distinct UA and spliced in.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(rec, option=orjson.OPT_INDENT_2 if pretty else 0)  # hot path
+        except orjson.JSONEncodeError:
+            return _dumps(rec, pretty)
+    ua = rec.get("ua")
+    if ua is None or _ua_fragments_max == 0 or next(reversed(rec)) != "ua":
+        return _dumps(rec, pretty)
+    key = (rec.get("http_user_agent") or "", pretty)
+    cached = _ua_fragments.get(key)
+    if cached is not None and cached[0] is ua:
+        fragment = cached[1]
+    else:
+        # New UA, or another object for it (re-enriched after an LRU eviction, or
+        # unpickled from a worker): encode this one and keep it for the records after.
+        if cached is None and _ua_fragments_max is not None and len(_ua_fragments) >= _ua_fragments_max:
+            _ua_fragments.clear()
+        fragment = _dumps(ua, pretty)
+        if pretty:
+            fragment = fragment.replace(b"\n", b"\n  ")  # nested one level in the record
+        _ua_fragments[key] = (ua, fragment)
+    rest = dict(rec)
+    del rest["ua"]  # "ua" is the last key, so it goes back at the end
+    head = _dumps(rest, pretty)
+    if pretty:
+        return head[:-2] + b',\n  "ua": ' + fragment + b"\n}"
+    return head[:-1] + b', "ua": ' + fragment + b"}"
+
+
+def write_ndjson(out_fp: BinaryIO, records: Iterable[Dict[str, Any]]) -> int:
+    """Write one compact JSON object per line. Returns the number of records written."""
+    count = 0
+    for rec in records:
+        out_fp.write(_dumps_record(rec) + b"\n")
+        count += 1
+    return count
+
+
+def _render_ndjson_chunk(job: Tuple[int, List[str]], summarize: bool = False, emit_iso: bool = True
+                         ) -> Tuple[bytes, int, List[Tuple[int, str]], Optional[SummaryAccumulator]]:
+    """
+    Worker-side: parse one chunk straight to NDJSON bytes, so a pool only has to send
+    back one bytes blob (plus errors and partial summary counts) instead of every record.
+    """
+    out: List[bytes] = []
+    errors: List[Tuple[int, str]] = []
+    acc = SummaryAccumulator() if summarize else None
+    for rec, err in _parse_chunk(job, emit_iso):
+        out.append(_dumps_record(rec))
+        if err is not None:
+            errors.append((rec["line_number"], err))
+        if acc is not None:
+            acc.update(rec)
+    out.append(b"")
+    return b"\n".join(out), len(out) - 1, errors, acc
+
+
+def write_ndjson_lines(out_fp: BinaryIO, lines: Iterable[str], jobs: int = 1,
+                       summary: Optional[SummaryAccumulator] = None,
+                       emit_iso: bool = True) -> Tuple[int, List[Tuple[int, str]]]:
+    """
+    Parse raw lines and write them as NDJSON (same bytes as write_ndjson(iter_records(...))).
+    Counts are folded into `summary` when given.
+    Returns (records written, (line, error_reason) for any failures).
+    """
+    count = 0
+    errors: List[Tuple[int, str]] = []
+    it, parallel = _peek_parallel(lines, jobs)
+    if not parallel:
+        for rec, err in iter_records(it, 1, emit_iso):
+            out_fp.write(_dumps_record(rec) + b"\n")
+            count += 1
+            if err is not None:
+                errors.append((rec["line_number"], err))
+            if summary is not None:
+                summary.update(rec)
+        return count, errors
+
+    worker = functools.partial(_render_ndjson_chunk, summarize=summary is not None, emit_iso=emit_iso)
+    for blob, n, chunk_errors, acc in _pool_map_chunks(it, jobs, worker):
+        out_fp.write(blob)
+        count += n
+        errors.extend(chunk_errors)
+        if summary is not None and acc is not None:
+            summary.merge(acc)
+    return count, errors
+
+
+def write_json_array(out_fp: BinaryIO, records: Iterable[Dict[str, Any]],
+                     pretty: bool = False, depth: int = 0) -> int:
+    """
+    Write records as a JSON array without holding them all in memory.
+    `depth` is the nesting level of the array (for pretty indentation).
+    Returns the number of records written.
+    """
+    newline = b"\n" + b"  " * (depth + 1) if pretty else b""
+    count = 0
+    out_fp.write(b"[")
+    for rec in records:
+        if pretty:
+            chunk = _dumps_record(rec, pretty).replace(b"\n", newline)
+        else:
+            chunk = _dumps_record(rec)
+        out_fp.write((b"," if count else b"") + newline + chunk)
+        count += 1
+    out_fp.write(b"\n" + b"  " * depth + b"]" if pretty and count else b"]")
+    return count
+
+
 # --- Small summary printout (handy for quick checks) ---
 def _top(counter: Counter, k: int = 5) -> List[str]:
     return [f"{name} ({count})" for name, count in counter.most_common(k)]
 
 
-def print_summary(records: List[Dict[str, Any]]) -> None:
-    total = len(records)
+@dataclass
+class SummaryAccumulator:
+    """
+    Running --summary counts, folded in one record at a time (records aren't kept).
+    The UA breakdowns are tallied per distinct User-Agent string (one counter bump per
+    record) and only expanded into browser / OS / device counts when read.
+    """
+    total: int = 0
+    unique_ips: Set[str] = field(default_factory=set)
+    by_status: Counter = field(default_factory=Counter)
+    by_ua: Counter = field(default_factory=Counter)
+    ua_info: Dict[Optional[str], Optional[Dict[str, Any]]] = field(default_factory=dict)
+
+    def update(self, r: Dict[str, Any]) -> None:
+        self.total += 1
+        ip = r.get("remote_addr")
+        if ip:
+            self.unique_ips.add(ip)
+        ua_s = r.get("http_user_agent")
+        self.by_ua[ua_s] += 1
+        if ua_s not in self.ua_info:
+            self.ua_info[ua_s] = r.get("ua")  # same UA string, same enrichment
+        self.by_status[r.get("status")] += 1
+
+    def merge(self, other: SummaryAccumulator) -> None:
+        """Add another accumulator's counts (e.g. one gathered by a worker process)."""
+        self.total += other.total
+        self.unique_ips |= other.unique_ips
+        self.by_status.update(other.by_status)
+        self.by_ua.update(other.by_ua)
+        for ua_s, ua in other.ua_info.items():
+            self.ua_info.setdefault(ua_s, ua)
+
+    def _by_ua_field(self, key: Callable[[Dict[str, Any]], Any], missing: Any) -> Counter:
+        counts: Counter = Counter()
+        for ua_s, n in self.by_ua.items():
+            ua = self.ua_info[ua_s]
+            counts[key(ua) if ua else missing] += n
+        return counts
+
+    @property
+    def by_browser(self) -> Counter:
+        return self._by_ua_field(lambda ua: ua["browser"]["family"], None)
+
+    @property
+    def by_os(self) -> Counter:
+        return self._by_ua_field(lambda ua: (ua["os"]["family"], ua["os"]["version"]), (None, None))
+
+    @property
+    def by_device(self) -> Counter:
+        return self._by_ua_field(lambda ua: ua["device"]["type"], None)
+
+
+def print_summary(records: Union[SummaryAccumulator, Iterable[Dict[str, Any]]]) -> None:
+    # Either counts gathered while streaming, or any iterable of records (one pass).
+    if isinstance(records, SummaryAccumulator):
+        acc = records
+    else:
+        acc = SummaryAccumulator()
+        for r in records:
+            acc.update(r)
+    total = acc.total
+
     if total == 0:
         print("Summary:\n---------\nNo records parsed.")
         return
 
-    unique_ips = {r.get("remote_addr") for r in records if r.get("remote_addr")}
-    by_browser = Counter((r.get("ua") or {}).get("browser", {}).get("family") for r in records)
-    by_os = Counter(((r.get("ua") or {}).get("os", {}).get("family"),
-                     (r.get("ua") or {}).get("os", {}).get("version")) for r in records)
-    by_device = Counter((r.get("ua") or {}).get("device", {}).get("type") for r in records)
-    by_status = Counter(r.get("status") for r in records)
-
     def fmt_os(k: Tuple[Optional[str], Optional[str]]) -> str:
         fam, ver = k
         if fam is None and ver is None:
@@ -360,34 +944,95 @@ def print_summary(records: List[Dict[str, Any]]) -> None:
     print("Summary:")
     print("---------")
     print(f"Total requests: {total}")
-    print(f"Unique IPs: {len(unique_ips)}")
-    print(f"Top Browsers: {', '.join(_top(by_browser))}")
-    print(f"Top OS: {', '.join([f'{fmt_os(k)} ({c})' for k, c in by_os.most_common(5)])}")
-    print(f"Devices: {', '.join(_top(by_device))}")
-    print(f"HTTP Statuses: {', '.join([f'{k} ({v})' for k, v in by_status.most_common()])}")
+    print(f"Unique IPs: {len(acc.unique_ips)}")
+    print(f"Top Browsers: {', '.join(_top(acc.by_browser))}")
+    print(f"Top OS: {', '.join([f'{fmt_os(k)} ({c})' for k, c in acc.by_os.most_common(5)])}")
+    print(f"Devices: {', '.join(_top(acc.by_device))}")
+    print(f"HTTP Statuses: {', '.join([f'{k} ({v})' for k, v in acc.by_status.most_common()])}")
 
 
 # --- CLI entrypoint ---
+class _InputReadError(Exception):
+    """Reading the input failed (kept apart from errors writing the output)."""
+
+
+def _read_lines(fp: TextIO) -> Iterator[str]:
+    try:
+        yield from fp
+    except OSError as e:
+        raise _InputReadError(e) from e
+
+
+def _same_file(in_fp: TextIO, path: str) -> bool:
+    """True if the output path is the regular file the input is being read from."""
+    try:
+        in_st, out_st = os.fstat(in_fp.fileno()), os.stat(path)
+    except (AttributeError, OSError, ValueError):  # no output file yet, or no fd behind the input
+        return False
+    return stat.S_ISREG(out_st.st_mode) and os.path.samestat(in_st, out_st)
+
+
+def _open_temp_output(target: str) -> Tuple[BinaryIO, str]:
+    """
+    Open a temp file beside ``target`` (an existing, already resolved path) that main()
+    renames over it once complete: used when -o is the input, so truncating the output
+    can't cut the read short. Mode, and ownership where allowed, follow the original.
+    """
+    st = os.stat(target)
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(target) + ".", suffix=".tmp",
+                                    dir=os.path.dirname(target))
+    try:
+        os.chmod(tmp_path, stat.S_IMODE(st.st_mode))  # mkstemp makes it 0600
+        if hasattr(os, "chown"):
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except OSError:
+                pass  # not ours to give away; keep our own ownership
+    except BaseException:
+        os.close(fd)
+        os.unlink(tmp_path)
+        raise
+    return os.fdopen(fd, "wb"), tmp_path
+
+
 def main() -> None:
     parser = argparse.ArgumentParser(description="Parse & enrich Nginx combined access logs.")
     parser.add_argument("-i", "--input", default="-", help="Input path or '-' for stdin")
     parser.add_argument("-o", "--output", default="-", help="Output path or '-' for stdout")
     parser.add_argument("--pretty", action="store_true", help="Pretty-print JSON")
     parser.add_argument("--summary", action="store_true", help="Print a summary report")
-    parser.add_argument("--wrap", action="store_true", help="Wrap array in an object with metadata + entries")
+    parser.add_argument("--wrap", action="store_true", help="Wrap array in an object with entries + metadata")
+    parser.add_argument("--ndjson", action="store_true", help="Write one JSON object per line instead of an array")
     parser.add_argument("--strict", action="store_true", help="Exit with code 2 if any parse errors occurred")
     parser.add_argument("--errors", help="Optional path to write error lines (lineno + reason)")
+    parser.add_argument("--ua-cache-size", type=int, default=UA_CACHE_SIZE,
+                        help=f"Max distinct User-Agents to memoize (0 disables; default {UA_CACHE_SIZE})")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                        help=f"Worker processes for inputs over {PARALLEL_MIN_LINES} lines (default: CPU count)")
+    parser.add_argument("--no-iso-times", action="store_true",
+                        help="Leave out time_iso_utc (skips the per-line time conversion)")
     args = parser.parse_args()
+    if args.ndjson and args.wrap:
+        parser.error("--wrap cannot be combined with --ndjson")
+
+    if args.ua_cache_size != UA_CACHE_SIZE:
+        set_ua_cache_size(max(args.ua_cache_size, 0))
 
     start_ts = time.time()
 
     # Input source (file or stdin)
+    in_fp: TextIO
     if args.input == "-" or args.input.lower() == "stdin":
-        in_fp = sys.stdin
+        try:
+            in_fp = io.open(sys.stdin.fileno(), "r", encoding="utf-8", errors="replace",
+                            buffering=INPUT_BUFFER_SIZE, closefd=False)
+        except (AttributeError, OSError, ValueError):
+            in_fp = sys.stdin  # no real file descriptor behind stdin
         close_in = False
     else:
         try:
-            in_fp = open(args.input, "r", encoding="utf-8", errors="replace")
+            in_fp = open(args.input, "r", encoding="utf-8", errors="replace",
+                         buffering=INPUT_BUFFER_SIZE)
             close_in = True
         except FileNotFoundError:
             print(f"Error: input file not found: {args.input}", file=sys.stderr)
@@ -396,11 +1041,102 @@ def main() -> None:
             print(f"Error opening input: {e}", file=sys.stderr)
             sys.exit(1)
 
+    # We read front to back: let the kernel read ahead harder (pipes / non-POSIX just skip it).
+    if hasattr(os, "posix_fadvise"):
+        try:
+            os.posix_fadvise(in_fp.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        except (OSError, ValueError):
+            pass
+
+    # Output destination (file or stdout), written as records are parsed
+    to_stdout = args.output == "-" or args.output.lower() == "stdout"
+    lines: Iterable[str] = _read_lines(in_fp)
+    tmp_path: Optional[str] = None
+    target = args.output
+    try:
+        out_fp: BinaryIO
+        if to_stdout:
+            out_fp = sys.stdout.buffer
+        elif _same_file(in_fp, args.output):
+            target = os.path.realpath(args.output)  # replace the file a symlink points at
+            try:
+                out_fp, tmp_path = _open_temp_output(target)
+            except OSError:
+                # No temp file possible (e.g. read-only directory): take in the whole
+                # input first, then overwrite the file in place.
+                lines = list(lines)
+                out_fp = open(target, "wb")
+        else:
+            out_fp = open(args.output, "wb")
+    except _InputReadError as e:
+        print(f"Error reading input: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error writing output: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    errs: List[Tuple[int, str]] = []
+    summary = SummaryAccumulator()
+    emit_iso = not args.no_iso_times
+
+    def tracked() -> Iterator[Dict[str, Any]]:
+        for rec, err in iter_records(lines, max(args.jobs, 1), emit_iso):
+            if err is not None:
+                errs.append((rec["line_number"], err))
+            if args.summary:
+                summary.update(rec)  # folded as we go; records aren't kept around
+            yield rec
+
     try:
-        records, errs = process_stream(in_fp)
+        if args.ndjson:
+            # Records never need to exist outside the workers: they send back encoded lines.
+            _, ndjson_errs = write_ndjson_lines(out_fp, lines, max(args.jobs, 1),
+                                                summary if args.summary else None, emit_iso)
+            errs.extend(ndjson_errs)
+        elif args.wrap:
+            # Metadata needs the final counts, so it follows the streamed entries.
+            out_fp.write(b'{\n  "entries": ' if args.pretty else b'{"entries":')
+            total = write_json_array(out_fp, tracked(), args.pretty, depth=1)
+            metadata = _dumps({
+                "source": args.input,
+                "generated_at": datetime.now(timezone.utc).isoformat(),
+                "duration_ms": int((time.time() - start_ts) * 1000),
+                "total_lines": total,
+                "parse_errors": len(errs),
+                "user_agent_parser": "user-agents" if ua_parse is not None else "heuristics",
+            }, args.pretty)
+            if args.pretty:
+                out_fp.write(b',\n  "metadata": ' + metadata.replace(b"\n", b"\n  ") + b"\n}\n")
+            else:
+                out_fp.write(b',"metadata":' + metadata + b"}\n")
+        else:
+            write_json_array(out_fp, tracked(), args.pretty)  # matches assessment: array of JSON objects
+            out_fp.write(b"\n")
+        out_fp.flush()
+        if not to_stdout:
+            out_fp.close()
+        if close_in:
+            in_fp.close()  # before the rename, in case -o is the input (and for Windows)
+        if tmp_path is not None:
+            os.replace(tmp_path, target)
+            tmp_path = None
+    except _InputReadError as e:
+        print(f"Error reading input: {e}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"Error writing output: {e}", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"Error processing input: {e}", file=sys.stderr)
+        sys.exit(1)
     finally:
-        if 'close_in' in locals() and close_in:
+        if close_in:
             in_fp.close()
+        if tmp_path is not None:  # failed or interrupted: leave the input file untouched
+            out_fp.close()
+            os.unlink(tmp_path)
+    if not to_stdout:
+        print(f"Output written to {args.output}")
 
     # Optional separate error log
     if args.errors and errs:
@@ -411,42 +1147,14 @@ def main() -> None:
         except Exception as e:
             print(f"Warning: failed to write errors file '{args.errors}': {e}", file=sys.stderr)
 
-    # Build output (array by default; wrap when asked)
-    duration_ms = int((time.time() - start_ts) * 1000)
-    if args.wrap:
-        payload: Any = {
-            "metadata": {
-                "source": args.input,
-                "generated_at": datetime.now(timezone.utc).isoformat(),
-                "duration_ms": duration_ms,
-                "total_lines": len(records),
-                "parse_errors": len(errs),
-                "user_agent_parser": "user-agents" if ua_parse is not None else "heuristics",
-            },
-            "entries": records,
-        }
-    else:
-        payload = records  # matches assessment: array of JSON objects
-
-    out_text = json.dumps(payload, indent=2 if args.pretty else None, ensure_ascii=False)
-
-    # Output destination (file or stdout)
-    if args.output == "-" or args.output.lower() == "stdout":
-        sys.stdout.write(out_text + ("\n" if not out_text.endswith("\n") else ""))
-    else:
-        try:
-            with open(args.output, "w", encoding="utf-8") as f:
-                f.write(out_text)
-                if not out_text.endswith("\n"):
-                    f.write("\n")
-            print(f"Output written to {args.output}")
-        except Exception as e:
-            print(f"Error writing output: {e}", file=sys.stderr)
-            sys.exit(1)
-
     # Optional summary
     if args.summary:
-        print_summary(records)
+        print_summary(summary)
+        # Only meaningful on the serial path: pool workers keep their own caches.
+        pooled = args.jobs > 1 and summary.total >= PARALLEL_MIN_LINES
+        cache = ua_cache_info()
+        if not pooled and (cache.hits or cache.misses):
+            print(f"UA cache: {cache.hits} hits, {cache.misses} misses, {cache.currsize} cached")
 
     # Optional strict mode
     if args.strict and errs:
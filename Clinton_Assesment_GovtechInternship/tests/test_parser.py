@@ -1,9 +1,26 @@
 # tests/test_parser.py
 import io
+import json
+import re
+import sys
+from pathlib import Path
 from typing import Optional, List, Tuple, Dict, Any
 
+import pytest
+
 # Import from your script (humanized Version A)
-from main import parse_line, process_stream, print_summary
+import main
+from main import parse_line, process_stream, print_summary, parse_time_local
+from main import write_ndjson, write_json_array, write_ndjson_lines, SummaryAccumulator
+
+SAMPLE_LOG = Path(__file__).parent.parent / "sample_access.log"
+
+@pytest.fixture
+def pooled_lines(monkeypatch):
+    """Sample log x5 with bad/empty lines mixed in; --jobs thresholds shrunk so the pool starts."""
+    monkeypatch.setattr(main, "PARALLEL_MIN_LINES", 20)
+    monkeypatch.setattr(main, "PARALLEL_CHUNK_LINES", 7)
+    return (SAMPLE_LOG.read_text(encoding="utf-8").splitlines(True) + ["not a log line\n", "\n"]) * 5
 
 # 1) Basic happy-path desktop (Chrome/Windows)
 def test_valid_combined_line_basic():
@@ -129,3 +146,208 @@ def test_request_with_space_in_path():
     assert rec["method"] == "GET"
     assert rec["path"] == "/reports"
     assert rec["protocol"] == "HTTP/1.1"
+
+# 11) Repeated UA strings reuse the memoized enrichment
+def test_repeated_ua_is_cached():
+    ua = "Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0"
+    line = f'203.0.113.5 - - [12/Sep/2025:09:14:00 +0800] "GET / HTTP/1.1" 200 10 "-" "{ua}"'
+    first, _ = parse_line(line, 1)
+    second, _ = parse_line(line, 2)
+    assert first["ua"] is second["ua"]
+    assert first["ua"]["os"]["family"] == "Linux"
+
+# 12) time_local -> UTC ISO8601, including negative offsets and bad input
+def test_parse_time_local_offsets():
+    assert parse_time_local("12/Sep/2025:09:12:03 +0800") == "2025-09-12T01:12:03+00:00"
+    assert parse_time_local("31/Dec/2024:23:59:59 -0530") == "2025-01-01T05:29:59+00:00"
+    assert parse_time_local("12/Foo/2025:09:12:03 +0800") == "12/Foo/2025:09:12:03 +0800"
+
+# 13) Streamed writers produce valid JSON / NDJSON
+def test_streamed_writers_round_trip():
+    with open(SAMPLE_LOG, encoding="utf-8") as fp:
+        records, _ = process_stream(fp)
+    nd = io.BytesIO()
+    assert write_ndjson(nd, records) == len(records)
+    assert [json.loads(l) for l in nd.getvalue().splitlines()] == records
+    arr = io.BytesIO()
+    write_json_array(arr, iter(records), pretty=True)
+    assert json.loads(arr.getvalue()) == records
+
+# 14) Irregular spacing skips the fast splitter but still parses via the regex
+def test_irregular_spacing_uses_regex_fallback():
+    line = '203.0.113.10  -  alice  [12/Sep/2025:09:12:03 +0800]  "GET /a HTTP/1.1"  200  15  "-"  "curl/8.4.0"'
+    rec, err = parse_line(line, 14)
+    assert err is None and rec["parse_ok"] is True
+    assert rec["remote_user"] == "alice"
+    assert rec["path"] == "/a" and rec["status"] == 200 and rec["body_bytes_sent"] == 15
+
+# 15) emit_iso=False leaves time_iso_utc out but keeps the raw time_local
+def test_emit_iso_false_omits_iso_time():
+    line = '203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 200 1 "-" "curl/8.4.0"'
+    rec, err = parse_line(line, 15, emit_iso=False)
+    assert err is None
+    assert "time_iso_utc" not in rec
+    assert rec["time_local"] == "12/Sep/2025:09:12:03 +0800"
+
+# 16) Summary counts folded per record (and merged across chunks) match a plain pass
+def test_summary_accumulator_matches_records(capsys):
+    lines = SAMPLE_LOG.read_text(encoding="utf-8").splitlines(True)
+    records, _ = process_stream(lines)
+    first, second = SummaryAccumulator(), SummaryAccumulator()
+    for i, rec in enumerate(records):
+        (first if i < 4 else second).update(rec)
+    first.merge(second)
+    assert first.total == len(records)
+    print_summary(records)
+    expected = capsys.readouterr().out
+    print_summary(first)
+    assert capsys.readouterr().out == expected
+
+# 17) Without orjson the cached "ua" fragment is spliced in; bytes must match json.dumps
+@pytest.mark.skipif(main.__file__.endswith((".so", ".pyd")),
+                    reason="mypyc-compiled main binds its orjson import; patching it has no effect")
+def test_stdlib_json_ua_splice_matches_json_dumps(monkeypatch):
+    monkeypatch.setattr(main, "orjson", None)
+    main.set_ua_cache_size(main.UA_CACHE_SIZE)  # start from empty caches
+    line = '203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 200 1 "-" "Mozilla/5.0 (iPhone; CPU iPhone OS 17_2 like Mac OS X) Safari/604.1 \u00e9"'
+    for n in (1, 2):  # first call fills the fragment cache, second one reuses it
+        rec, _ = parse_line(line, n)
+        assert main._dumps_record(rec) == json.dumps(rec, ensure_ascii=False).encode("utf-8")
+        assert main._dumps_record(rec, pretty=True) == json.dumps(rec, indent=2, ensure_ascii=False).encode("utf-8")
+    assert len(main._ua_fragments) == 2  # one compact and one pretty entry
+    main._enrich_user_agent_cached.cache_clear()  # as after an LRU eviction: a new "ua" object
+    rec, _ = parse_line(line, 3)
+    assert main._dumps_record(rec) == json.dumps(rec, ensure_ascii=False).encode("utf-8")
+    assert main._ua_fragments[(rec["http_user_agent"], False)][0] is rec["ua"]  # the entry moved over
+
+# 18) Writing the output over the input still sees the whole input (temp file + rename)
+def test_output_can_replace_input(tmp_path, monkeypatch):
+    log = tmp_path / "access.log"
+    log.write_text('203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 200 1 "-" "curl/8.4.0"\n', encoding="utf-8")
+    monkeypatch.setattr("sys.argv", ["main.py", "-i", str(log), "-o", str(log)])
+    main.main()
+    records = json.loads(log.read_text(encoding="utf-8"))
+    assert len(records) == 1 and records[0]["path"] == "/"
+    assert [f.name for f in tmp_path.iterdir()] == ["access.log"]  # no temp file left behind
+
+# 19) --jobs NDJSON: workers send back encoded chunks; bytes, errors and merged summary
+#     must equal the serial run (thresholds shrunk so the pool really starts)
+def test_parallel_ndjson_matches_serial(pooled_lines):
+    results = []
+    for jobs in (1, 2):
+        out, summary = io.BytesIO(), SummaryAccumulator()
+        count, errors = write_ndjson_lines(out, pooled_lines, jobs, summary)
+        results.append((out.getvalue(), count, errors, summary))
+    assert results[0] == results[1]
+    assert results[0][1] == len(pooled_lines) and len(results[0][2]) == 10
+
+# 20) --jobs parsing: pooled records come back in input order with the same line
+#     numbers and errors as the serial run, across chunk boundaries
+def test_parallel_process_stream_matches_serial(pooled_lines):
+    serial = process_stream(pooled_lines, jobs=1)
+    pooled = process_stream(pooled_lines, jobs=2)
+    assert pooled == serial
+    assert [r["line_number"] for r in pooled[0]] == list(range(1, len(pooled_lines) + 1))
+    assert len(pooled[1]) == 10
+
+# 21) -o through a symlink writes the file it points at, and leaves the link alone
+#     (also when that file is the input, the one case that goes via a temp file)
+def test_output_symlink_is_written_through(tmp_path, monkeypatch):
+    log = tmp_path / "access.log"
+    log.write_text('203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 200 1 "-" "curl/8.4.0"\n', encoding="utf-8")
+    target, link = tmp_path / "target.json", tmp_path / "link.json"
+    target.write_text("{}", encoding="utf-8")
+    link.symlink_to(target)
+    monkeypatch.setattr("sys.argv", ["main.py", "-i", str(log), "-o", str(link)])
+    main.main()
+    assert link.is_symlink() and json.loads(target.read_text(encoding="utf-8"))[0]["path"] == "/"
+
+    log_link = tmp_path / "log.link"
+    log_link.symlink_to(log)
+    monkeypatch.setattr("sys.argv", ["main.py", "-i", str(log_link), "-o", str(log_link)])
+    main.main()
+    assert log_link.is_symlink() and json.loads(log.read_text(encoding="utf-8"))[0]["path"] == "/"
+    assert sorted(f.name for f in tmp_path.iterdir()) == ["access.log", "link.json", "log.link", "target.json"]
+
+# 22) Keyword heuristics (no user-agents), with and without the Aho-Corasick scan:
+#     browser priority, Windows/macOS/Android/iOS versions and device types
+@pytest.fixture(params=["automaton", "substring"])
+def heuristic_ua(request, monkeypatch):
+    if request.param == "automaton" and main._UA_AUTOMATON is None:
+        pytest.skip("pyahocorasick not installed")
+    monkeypatch.setattr(main, "ua_parse", None)
+    if request.param == "substring":
+        monkeypatch.setattr(main, "_UA_AUTOMATON", None)
+    main.set_ua_cache_size(main.UA_CACHE_SIZE)  # nothing cached by the other parser leaks in
+    yield request.param
+    main.set_ua_cache_size(main.UA_CACHE_SIZE)
+
+UA_CASES = [
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Safari/537.36 Edg/119.0",
+     "Edge", "Windows", "10", "PC"),
+    ("Mozilla/5.0 (Windows NT 10.0; Win64; x64; Windows 11) AppleWebKit/537.36 (KHTML, like Gecko) Edg/119.0.1108.62",
+     "Edge", "Windows", "11", "PC"),
+    ("Mozilla/5.0 (Windows NT 6.1; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Safari/537.36 OPR/105.0",
+     "Opera", "Windows", "7", "PC"),
+    ("Mozilla/5.0 (Windows NT 6.2; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/119.0 Safari/537.36",
+     "Chrome", "Windows", "8", "PC"),
+    ("Mozilla/5.0 (Windows NT 6.3; Win64; x64; rv:119.0) Gecko/20100101 Firefox/119.0",
+     "Firefox", "Windows", "8.1", "PC"),
+    ("Mozilla/5.0 (Macintosh; Intel Mac OS X 13_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.2 Safari/605.1.15",
+     "Safari", "macOS", "13.6", "PC"),
+    ("Mozilla/5.0 (Linux; Android 14; Pixel 8) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Mobile Safari/537.36",
+     "Chrome", "Android", "14", "Mobile"),
+    ("Mozilla/5.0 (Linux; Android 13; SAMSUNG SM-T870; Tablet) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/117.0.5938.60 Mobile Safari/537.36",
+     "Chrome", "Android", "13", "Tablet"),
+    ("Mozilla/5.0 (iPhone; CPU iPhone OS 17_2) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Mobile/15E148 Safari/604.1",
+     "Safari", "iOS", "17.2", "Mobile"),
+    ("Mozilla/5.0 (iPad; CPU OS 16_6) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1",
+     "Safari", "iOS", "16.6", "Tablet"),
+    ("Mozilla/5.0 (X11; Linux x86_64; rv:121.0) Gecko/20100101 Firefox/121.0",
+     "Firefox", "Linux", None, "PC"),
+    ("Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+     None, None, None, "Bot"),
+    ("curl/8.4.0", None, None, None, "Other"),
+]
+
+@pytest.mark.parametrize("ua, browser, os_family, os_version, dtype", UA_CASES)
+def test_heuristic_ua_fallback(heuristic_ua, ua, browser, os_family, os_version, dtype):
+    info = main.enrich_user_agent(ua)
+    assert info["browser"]["family"] == browser
+    assert (info["os"]["family"], info["os"]["version"]) == (os_family, os_version)
+    device = info["device"]
+    assert device["type"] == dtype
+    set_flags = [k for k in ("is_mobile", "is_tablet", "is_pc", "is_bot") if device[k]]
+    assert set_flags == ([] if dtype == "Other" else ["is_" + dtype.lower()])
+
+# 23) Prefix-gated substring scan finds exactly the keywords a plain scan would
+#     (so a keyword added to _UA_TOKENS can't drop out of _UA_TOKEN_GROUPS)
+@pytest.mark.parametrize("ua", [case[0] for case in UA_CASES] + ["", "Opera/9.80 (Windows NT 6.1) Presto Edge/18 edg spider crawler"])
+def test_substring_scan_matches_plain_scan(monkeypatch, ua):
+    monkeypatch.setattr(main, "_UA_AUTOMATON", None)
+    ua_lc = ua.lower()
+    assert main._scan_ua_tokens(ua_lc) == sum(bit for tok, bit in main._UA_TOKEN_BITS if tok in ua_lc)
+
+# 24) A malformed UA_CACHE falls back to the default with a warning instead of crashing
+def test_bad_env_int_falls_back(monkeypatch, capsys):
+    monkeypatch.setenv("UA_CACHE", "abc")
+    assert main._env_int("UA_CACHE", 50000) == 50000
+    assert "UA_CACHE" in capsys.readouterr().err
+    monkeypatch.setenv("UA_CACHE", "128")
+    assert main._env_int("UA_CACHE", 50000) == 128
+
+# 25) The possessive (3.11+) combined pattern matches exactly what the plain one does
+@pytest.mark.skipif(sys.version_info < (3, 11), reason="possessive quantifiers need Python 3.11+")
+def test_possessive_pattern_matches_plain():
+    plain, possessive = re.compile(main._COMBINED_PATTERN), re.compile(main._COMBINED_PATTERN_POSSESSIVE)
+    assert plain.groupindex == possessive.groupindex
+    lines = SAMPLE_LOG.read_text(encoding="utf-8").splitlines() + [
+        '203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 200 1 "-" "ua" trailing',
+        '203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 2000 1 "-" "ua"',
+        '203.0.113.10  -  -  [x]  ""  200  -  ""  ""',
+        '203.0.113.10 - - [12/Sep/2025:09:12:03 +0800] "GET / HTTP/1.1" 200 1 "-" "unterminated',
+        "", "not a log line",
+    ]
+    for line in lines:
+        a, b = plain.match(line), possessive.match(line)
+        assert (a and a.groups()) == (b and b.groups()), line